@@ -13,6 +13,7 @@ PROXY="${PROXY}"
 
 CLEAR="${CLEAR}"
 DELETE="${DELETE}"
+VERIFY="${VERIFY}"
 
 GCAL_UID="$(id -u gcal)"
 GCAL_GID="$(id -g gcal)"
@@ -40,6 +41,11 @@ then
   IMPORT_CMD+=(--delete)
 fi
 
+if [[ -n "$VERIFY" ]]
+then
+  IMPORT_CMD+=(--verify)
+fi
+
 # Confluence settings
 if [[ -n "$CONFLUENCE_URL" ]]
 then
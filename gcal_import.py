@@ -1,154 +1,565 @@
 #!/usr/bin/env python3
 
 import argparse
+import hashlib
+import json
 import logging
+import os
+import random
 import re
 import sys
-from datetime import datetime
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timezone
+from itertools import chain
 from pprint import pformat
+from time import sleep
 
-import coloredlogs
 import icalendar
 import requests
-
-from atlassian import Confluence
-from gcsa.event import Event as GoogleCalendarEvent
-from gcsa.google_calendar import GoogleCalendar
-from googleapiclient.errors import HttpError as GoogleHttpError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 LOGGER = logging.getLogger("gcal-ics-import")
 
+# Maximum number of sub-requests per batch request
+# https://developers.google.com/calendar/api/guides/batch
+BATCH_SIZE = 50
+# Number of batch requests sent concurrently
+BATCH_WORKERS = 4
+# How many times rate limited (or transiently failed) sub-requests are retried
+BATCH_RETRIES = 5
+# Number of Confluence calendars synced at a time
+CALENDAR_WORKERS = 4
+
+# VEVENT properties read by ics_to_gcal
+VEVENT_PROPERTIES = (
+    "UID",
+    "SUMMARY",
+    "DESCRIPTION",
+    "STATUS",
+    "LOCATION",
+    "TRANSP",
+    "DTSTART",
+    "DTEND",
+    "RRULE",
+)
+
+# Partial response for events that are only looked up or deleted, never
+# written back (updates replace the whole event)
+# https://developers.google.com/calendar/api/guides/performance#partial
+LOOKUP_FIELDS = "items(id,iCalUID,summary,start,end,recurrence),nextPageToken"
+
+# Downloaded ICS files are cached here, along with their ETag/Last-Modified.
+# Same goes for the events of the target calendars and their sync tokens.
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "gcal-import-ics",
+)
+
+# How long the calendar IDs of the account are cached, in seconds
+CALENDARS_CACHE_TTL = 24 * 60 * 60
+
+CALENDAR_ID_RE = re.compile(r".+@group\.calendar\.google\.com")
+UNTIL_RE = re.compile(r"UNTIL=(\d{8}(?:T\d{6})?)(Z?)")
+
+# Raw VEVENT blocks of an ICS file, and the properties we need to tell them
+# apart without parsing them. Folded lines need to be unfolded first.
+VEVENT_BLOCK_RE = re.compile(
+    rb"^BEGIN:VEVENT\r?$.*?^END:VEVENT\r?$\n?", re.MULTILINE | re.DOTALL
+)
+VEVENT_UID_RE = re.compile(rb"^UID(?:;[^:\r\n]*)?:(.*?)\r?$", re.MULTILINE)
+RECURRENCE_ID_RE = re.compile(rb"^RECURRENCE-ID[;:]", re.MULTILINE)
+FOLDED_LINE_RE = re.compile(rb"\r?\n[ \t]")
+
+
+def write_cache_file(path, data, what):
+    """
+    Atomically write data (bytes) to path. CACHE_DIR holds calendar data, it
+    is only accessible to the current user. Returns whether it succeeded.
+    """
+    try:
+        os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+        # makedirs leaves existing directories alone
+        os.chmod(CACHE_DIR, 0o700)
+        # Caches may be written concurrently, write to a file of our own
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        LOGGER.warning(f"Failed to cache {what}: {exc}")
+        return False
+    return True
+
 
 def gcal_get_event(gcal, ical_uid, single_events=False):
-    res = list(
-        gcal.get_events(
+    from gcsa.serializers.event_serializer import EventSerializer
+
+    # The iCalUID is all we need to find the event, gcsa's get_events would
+    # add a time window that the server has to scan
+    res = (
+        gcal.service.events()
+        .list(
+            calendarId=gcal.calendar,
             iCalUID=ical_uid,
-            time_min=datetime(1970, 1, 1),
-            time_max=datetime(3000, 1, 1),
-            single_events=single_events,
+            singleEvents=single_events,
+            fields=LOOKUP_FIELDS,
         )
+        .execute()
+        .get("items")
+    )
+    return EventSerializer.to_object(res[0]) if res else None
+
+
+def gcal_sync_events(gcal):
+    """
+    Fetch all events of the calendar, as raw API resources keyed by event ID.
+    The events are cached along with the sync token of the listing, so that
+    later runs only need to fetch the events that changed in the meantime
+    https://developers.google.com/calendar/api/guides/sync
+    """
+    from googleapiclient.errors import HttpError as GoogleHttpError
+
+    cache_key = hashlib.sha256(gcal.calendar.encode("utf-8")).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, f"{cache_key}.events.json")
+
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+        sync_token = cache["sync_token"]
+        events = cache["events"]
+    except (OSError, ValueError, KeyError):
+        sync_token = None
+        events = {}
+
+    params = {"calendarId": gcal.calendar, "singleEvents": False}
+    if sync_token:
+        LOGGER.debug("Fetching the events that changed since the last run")
+        params["syncToken"] = sync_token
+
+    page_token = None
+    while True:
+        try:
+            response = (
+                gcal.service.events()
+                .list(**params, pageToken=page_token)
+                .execute()
+            )
+        except GoogleHttpError as exc:
+            # 410: Gone -> the sync token expired, start over
+            if sync_token and exc.resp["status"] == "410":
+                LOGGER.warning("Sync token expired, fetching all events")
+                os.remove(cache_path)
+                return gcal_sync_events(gcal)
+            raise exc
+
+        for item in response.get("items", []):
+            # Deleted events show up as cancelled
+            if item.get("status") == "cancelled":
+                events.pop(item["id"], None)
+            else:
+                events[item["id"]] = item
+
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            break
+
+    write_cache_file(
+        cache_path,
+        json.dumps(
+            {"sync_token": response.get("nextSyncToken"), "events": events}
+        ).encode("utf-8"),
+        "calendar events",
     )
-    return res[0] if res else None
 
+    return events
+
+
+def gcal_index_events(gcal):
+    """
+    Fetch all events of the calendar at once and index them by iCalUID
+    """
+    from gcsa.serializers.event_serializer import EventSerializer
 
-def gcal_clear(gcal, dry_run=False):
-    res = list(
-        gcal.get_events(
-            time_min=datetime(1970, 1, 1),
-            time_max=datetime(3000, 1, 1),
-            single_events=False,
+    index = {}
+    for item in gcal_sync_events(gcal).values():
+        # Modified instances of recurring events share the iCalUID of their
+        # parent, we are only interested in the latter
+        if "recurringEventId" in item:
+            continue
+        index.setdefault(item.get("iCalUID"), EventSerializer.to_object(item))
+    return index
+
+
+def gcal_event_is_past(event, now):
+    """
+    Whether the event (or the last occurrence of a recurring event) ended
+    before now, an aware datetime. Dates and floating times are local.
+    Events whose recurrence cannot be evaluated are considered past, so that
+    they are left alone.
+    """
+    from dateutil.rrule import rrulestr
+
+    def aware(dt):
+        if not isinstance(dt, datetime):
+            dt = datetime.combine(dt, time.min)
+        return dt.astimezone()
+
+    def until_utc(match):
+        # DTSTART is aware, dateutil wants UNTIL in UTC then
+        if match.group(2):
+            return match.group()
+        value = match.group(1)
+        until = datetime.strptime(
+            value, "%Y%m%dT%H%M%S" if "T" in value else "%Y%m%d"
         )
+        return f"UNTIL={until.astimezone(timezone.utc):%Y%m%dT%H%M%SZ}"
+
+    start = aware(event.start)
+    end = aware(event.end)
+    if not event.recurrence:
+        return end < now
+
+    for rule in event.recurrence:
+        if not rule.startswith("RRULE:"):
+            continue
+        rule = UNTIL_RE.sub(until_utc, rule)
+        try:
+            if rrulestr(rule, dtstart=start).after(now - (end - start)):
+                return False
+        except (TypeError, ValueError) as exc:
+            LOGGER.debug("Failed to evaluate %s: %s", rule, exc)
+            return True
+    return True
+
+
+def gcal_retryable(exc):
+    """
+    Whether a batched sub-request failed because of rate limiting or a
+    transient server error, and should be retried with a backoff
+    https://developers.google.com/calendar/api/guides/errors
+    """
+    from googleapiclient.errors import HttpError as GoogleHttpError
+
+    if not isinstance(exc, GoogleHttpError):
+        return False
+    status = int(exc.resp.status)
+    if status in (429, 500, 502, 503, 504):
+        return True
+    if status != 403:
+        return False
+    try:
+        errors = json.loads(exc.content).get("error", {}).get("errors", [])
+    except (AttributeError, TypeError, ValueError):
+        return False
+    return any(
+        error.get("reason") in ("rateLimitExceeded", "userRateLimitExceeded")
+        for error in errors
     )
-    deleted = 0
-    for event in res:
-        if dry_run:
-            LOGGER.info(f'Dry run: Would have deleted event "{event.summary}"')
-        else:
-            try:
-                gcal.delete_event(event)
-            except GoogleHttpError as exc:
-                # Ignore 'Resource has been deleted' exceptions
-                if (
-                    exc.resp["status"] != "410"
-                ):  # 410: Gone -> "Resource has been deleted"
-                    LOGGER.error(
-                        "Exception caught while deleting:"
-                        f"{exc.error_details}\n{exc}"
-                    )
-                    raise exc
-            deleted = deleted + 1
-    return deleted
 
 
-def gcal_compare(event1, event2, ignore_sequence=False):
-    for prop in [
+def gcal_batch_execute(gcal, api_requests):
+    """
+    Execute (request_id, request) pairs through the batch endpoint, in chunks
+    of BATCH_SIZE, up to BATCH_WORKERS chunks at a time. Sub-requests that
+    were rate limited or hit a server error are retried with an exponential
+    backoff.
+    Returns a dict mapping request IDs to (response, exception)
+    """
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.http import build_http
+
+    results = {}
+    local = threading.local()
+
+    def callback(request_id, response, exception):
+        results[request_id] = (response, exception)
+
+    def execute(chunk):
+        # googleapiclient's HTTP transport is not thread-safe
+        if not hasattr(local, "http"):
+            local.http = AuthorizedHttp(gcal.credentials, http=build_http())
+        batch = gcal.service.new_batch_http_request(callback=callback)
+        for request_id, request in chunk:
+            batch.add(request, request_id=request_id)
+        batch.execute(http=local.http)
+
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+        for attempt in range(BATCH_RETRIES + 1):
+            chunks = []
+            for start in range(0, len(api_requests), BATCH_SIZE):
+                end = start + BATCH_SIZE
+                chunks.append(api_requests[start:end])
+
+            futures = [executor.submit(execute, chunk) for chunk in chunks]
+            for future in futures:
+                # Re-raise transport errors
+                future.result()
+
+            api_requests = [
+                (request_id, request)
+                for request_id, request in api_requests
+                if gcal_retryable(results[request_id][1])
+            ]
+            if not api_requests or attempt == BATCH_RETRIES:
+                break
+            delay = 2**attempt + random.random()
+            LOGGER.warning(
+                "%s requests were rate limited or failed, retrying in %.1fs",
+                len(api_requests),
+                delay,
+            )
+            sleep(delay)
+    return results
+
+
+def gcal_import_body(event):
+    """
+    events.import body for an event created by ics_to_gcal. It only carries
+    the ICS data, so there is no need to run it through gcsa's serializer.
+    """
+
+    def gcal_time(value):
+        if not isinstance(value, datetime):
+            return {"date": value.isoformat()}
+        res = {"dateTime": value.isoformat()}
+        # The offset in dateTime is enough for aware datetimes
+        if event.timezone:
+            res["timeZone"] = event.timezone
+        return res
+
+    body = {
+        "iCalUID": event.other["iCalUID"],
+        "summary": event.summary,
+        "description": event.description,
+        "location": event.location,
+        "start": gcal_time(event.start),
+        "end": gcal_time(event.end),
+        "recurrence": event.recurrence,
+        "transparency": event.transparency,
+        "status": event.other.get("status"),
+        "reminders": {"useDefault": True},
+    }
+    # Omit unset values instead of sending nulls and empty strings or lists
+    return {k: v for (k, v) in body.items() if v not in ("", None, [])}
+
+
+def gcal_import_request(gcal, event):
+    return gcal.service.events().import_(
+        calendarId=gcal.calendar,
+        body=gcal_import_body(event),
+        conferenceDataVersion=1,
+    )
+
+
+def gcal_update_request(gcal, event):
+    from gcsa.serializers.event_serializer import EventSerializer
+
+    return gcal.service.events().update(
+        calendarId=gcal.calendar,
+        eventId=event.event_id,
+        body=EventSerializer.to_json(event),
+        conferenceDataVersion=1,
+        sendUpdates="none",
+    )
+
+
+def gcal_delete_request(gcal, event):
+    return gcal.service.events().delete(
+        calendarId=gcal.calendar,
+        eventId=event.event_id,
+        sendUpdates="none",
+    )
+
+
+def gcal_delete_events(gcal, events):
+    """
+    Delete events through the batch endpoint. Returns the number of deleted
+    events
+    """
+    results = gcal_batch_execute(
+        gcal,
+        [
+            (str(i), gcal_delete_request(gcal, ev))
+            for i, ev in enumerate(events)
+        ],
+    )
+    for _, exc in results.values():
+        # Ignore 'Resource has been deleted' exceptions
+        if (
+            exc is not None and exc.resp["status"] != "410"
+        ):  # 410: Gone -> "Resource has been deleted"
+            LOGGER.error(
+                f"Exception caught while deleting: {exc.error_details}\n{exc}"
+            )
+            raise exc
+    return len(results)
+
+
+def gcal_clear(gcal, dry_run=False, existing_events=None):
+    # gcsa 2.x's get_events lists the default calendar regardless of
+    # gcal.calendar. The index comes from gcal.calendar and holds every
+    # event but the modified instances, which go away with their parent.
+    if existing_events is None:
+        existing_events = gcal_index_events(gcal)
+    res = list(existing_events.values())
+    if dry_run:
+        for event in res:
+            LOGGER.info('Dry run: Would have deleted event "%s"', event.summary)
+        return 0
+    return gcal_delete_events(gcal, res)
+
+
+# Properties compared by gcal_compare, cheapest and most likely to differ
+# first since tuples are compared item by item
+EventKey = namedtuple(
+    "EventKey",
+    [
         "summary",
-        "description",
-        "location",
         "start",
         "end",
-        "recurrence",
+        "location",
         "transparency",
-    ]:
-        p1 = getattr(event1, prop)
-        p2 = getattr(event2, prop)
-        if p1 in ["", None] and p2 in ["", None]:
-            # Consider empty string equal to None
-            continue
-        elif (
-            prop == "transparency"
-            and p1 in ["", None, "opaque"]
-            and p2 in ["", None, "opaque"]
-        ):
-            # "opaque" is the default transparency
-            continue
-        elif prop == "recurrence":
-            if not isinstance(p1, list) or not isinstance(p2, list):
-                LOGGER.error(
-                    "Recurrence is supposed to be a list, got:"
-                    f"{type(p1)} and {type(p2)})"
-                )
-                return False
-            if len(p1) != len(p2):
-                LOGGER.debug(f"Events differ by RRULE: {p1} != {p2}")
-                return False
-
-            # Sort both, so that we compare apples to apples
-            p1.sort()
-            p2.sort()
+        "status",
+        "sequence",
+        "description",
+        "recurrence",
+    ],
+)
+
+
+def gcal_event_key(event):
+    """
+    Normalized properties of an event, so that events can be compared with ==
+    """
+
+    def value(v):
+        # Consider empty string equal to None
+        return None if v in ("", None) else v
+
+    return EventKey(
+        summary=value(event.summary),
+        start=value(event.start),
+        end=value(event.end),
+        location=value(event.location),
+        # "opaque" is the default transparency
+        transparency=value(event.transparency) or "opaque",
+        # "confirmed" is the default status
+        status=value(event.other.get("status")) or "confirmed",
+        sequence=value(event.other.get("sequence")),
+        description=value(event.description),
+        # Remove RRULE: and split, neither the order of the rules nor the
+        # order of their parts matters
+        recurrence=frozenset(
+            frozenset(rule.removeprefix("RRULE:").split(";"))
+            for rule in event.recurrence
+        ),
+    )
 
-            LOGGER.debug(f"RRULE: Comparing {p1} to {p2}")
 
-            i = 0
-            while i < len(p1):
-                # Remove RRULE: and split
-                rrule1 = set(
-                    re.sub(
-                        r"^{0}".format(re.escape("RRULE:")), "", p1[i]
-                    ).split(";")
-                )
-                rrule2 = set(
-                    re.sub(
-                        r"^{0}".format(re.escape("RRULE:")), "", p2[i]
-                    ).split(";")
-                )
-                if rrule1 != rrule2:
-                    LOGGER.debug(
-                        f"Events differ by RRULE: {rrule1} != {rrule2}"
-                    )
-                    return False
-                i += 1
-        elif p1 != p2:
-            LOGGER.warning(f"The events differ by {prop}: {p1} != {p2}")
-            return False
-
-    # Check the "other" dict
-    other_keys = ["status"]
-    if not ignore_sequence:
-        other_keys.append("sequence")
-
-    for prop in other_keys:
-        p1 = event1.other.get(prop)
-        p2 = event2.other.get(prop)
-        if p1 in ["", None] and p2 in ["", None]:
-            # Consider empty string equal to None
-            continue
-        elif (
-            prop == "status"
-            and p1 in ["", None, "confirmed"]
-            and p2 in ["", None, "confirmed"]
-        ):
-            # "confirmed" is the default status
+def gcal_compare(event1, event2, ignore_sequence=False):
+    key1 = gcal_event_key(event1)
+    key2 = gcal_event_key(event2)
+    if ignore_sequence:
+        key1 = key1._replace(sequence=None)
+        key2 = key2._replace(sequence=None)
+    # Unchanged events are the common case
+    if key1 == key2:
+        return True
+
+    for prop, p1, p2 in zip(EventKey._fields, key1, key2):
+        if p1 == p2:
             continue
-        elif p1 != p2:
-            LOGGER.warning(f"The events differ by {prop}: {p1} != {p2}")
-            return False
+        if prop == "recurrence":
+            LOGGER.debug("Events differ by RRULE: %s != %s", p1, p2)
+        else:
+            LOGGER.warning("The events differ by %s: %s != %s", prop, p1, p2)
+        return False
 
     return True
 
 
+def http_session():
+    """
+    HTTP session for fetching ICS files. Reuses connections and retries
+    transient server errors and rate limiting with a backoff
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+        )
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+SESSION = http_session()
+
+
+def fetch_ics(url, proxies=None, auth=None):
+    """
+    Download the ICS file at url. The file is cached along with its ETag and
+    Last-Modified headers, so that it only gets downloaded again if it changed
+    """
+    cache_key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    data_path = os.path.join(CACHE_DIR, f"{cache_key}.ics")
+    meta_path = os.path.join(CACHE_DIR, f"{cache_key}.json")
+
+    headers = {}
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if os.path.exists(data_path):
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+    except (OSError, ValueError):
+        pass
+
+    # icalendar parses bytes just fine, no need to have requests guess
+    # the encoding and decode the whole body
+    with SESSION.get(
+        url,
+        proxies=proxies,
+        auth=auth,
+        headers=headers,
+        stream=True,
+        # Fail fast on unreachable hosts, be patient with slow exports
+        timeout=(5, 30),
+    ) as response:
+        if response.status_code == 304:
+            LOGGER.info("ICS file did not change, using the cached copy")
+            with open(data_path, "rb") as f:
+                return f.read()
+        ics_data = response.content
+
+    meta = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    # The headers must not outlive the data they describe
+    if (
+        response.ok
+        and any(meta.values())
+        and write_cache_file(data_path, ics_data, "ICS file")
+    ):
+        write_cache_file(
+            meta_path, json.dumps(meta).encode("utf-8"), "ICS file headers"
+        )
+
+    return ics_data
+
+
 def read_ics(file, proxy=None, auth=None):
-    if re.match("https?://.*", file):
+    if file.startswith(("http://", "https://")):
         rq_proxies = (
             {
                 "http": proxy,
@@ -159,68 +570,166 @@ def read_ics(file, proxy=None, auth=None):
         )
 
         LOGGER.info(f"Fetching ICS file from {file} (proxy: {proxy})")
-        ics_text = requests.get(file, proxies=rq_proxies, auth=auth).text
+        ics_data = fetch_ics(file, proxies=rq_proxies, auth=auth)
     else:
-        with open(file) as f:
-            ics_text = f.read()
+        with open(file, "rb") as f:
+            ics_data = f.read()
+
+    return ics_data
+
+
+def parse_ics(ics_data):
+    ical = icalendar.Calendar.from_ical(ics_data)
+    # VEVENTs are top-level components, no need to walk the whole tree
+    # (VALARMs, VTIMEZONE rules...). There is no need to move the recurrent
+    # event instances to the end either, import_events looks them up only
+    # once their "parent" recurring events have been imported.
+    return [c for c in ical.subcomponents if c.name == "VEVENT"]
+
+
+def vevent_cache_path(gcal, file):
+    cache_key = hashlib.sha256(
+        f"{gcal.calendar}\n{file}".encode("utf-8")
+    ).hexdigest()
+    return os.path.join(CACHE_DIR, f"{cache_key}.vevents.json")
+
+
+def load_vevent_cache(cache_path):
+    """
+    Hashes of the VEVENT blocks imported by the last run, mapped to the
+    (iCalUID, etag) of the resulting gcal events
+    """
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_vevent_cache(cache_path, ics_blocks, gcal_changes):
+    imported = {}
+    for event in chain(
+        gcal_changes["updated"],
+        gcal_changes["created"],
+        gcal_changes["untouched"],
+    ):
+        ical_uid = event.other.get("iCalUID")
+        etag = event.other.get("etag")
+        if ical_uid in ics_blocks and etag and not event.is_recurring_instance:
+            imported[ics_blocks[ical_uid]] = (ical_uid, etag)
+    write_cache_file(
+        cache_path, json.dumps(imported).encode("utf-8"), "imported events"
+    )
 
-    ical = icalendar.Calendar.from_ical(ics_text)
-    events = []
-    recurrent_event_instances = []
 
-    for item in ical.walk():
-        # Skip non-events
-        if item.name != "VEVENT":
-            LOGGER.debug(f"Not an event ({item.name}). Skip this ical item.")
+def strip_unchanged_vevents(ics_data, imported, existing_events):
+    """
+    Remove the VEVENT blocks that did not change since the last import from
+    the raw ICS data, so that they don't need to be parsed and compared again.
+    A block is only skipped if the gcal event it was imported as did not
+    change either (same etag). Recurring event instances and UIDs that appear
+    more than once are always kept.
+    Returns the remaining ICS data, the block hashes by iCalUID and the gcal
+    events of the skipped blocks.
+    """
+    blocks = {}
+    uid_counts = {}
+    for match in VEVENT_BLOCK_RE.finditer(ics_data):
+        block = FOLDED_LINE_RE.sub(b"", match.group())
+        if RECURRENCE_ID_RE.search(block):
             continue
-        elif "RECURRENCE-ID" in item:
-            recurrent_event_instances.append(item)
-        else:
-            events.append(item)
-    # Append the recurent event instances at the end so that they get
-    # processed last. Otherwise we'd end up trying to fetch a recurring
-    # event instance before we import the "parent" recurring event.
-    return events + recurrent_event_instances
+        uid = VEVENT_UID_RE.search(block)
+        if uid is None:
+            continue
+        ical_uid = uid.group(1).decode("utf-8", "replace")
+        uid_counts[ical_uid] = uid_counts.get(ical_uid, 0) + 1
+        blocks[match.span()] = (
+            ical_uid,
+            hashlib.sha256(match.group()).hexdigest(),
+        )
+
+    ics_blocks = {}
+    skipped = []
+    pieces = []
+    pos = 0
+    for (start, end), (ical_uid, block_hash) in blocks.items():
+        if uid_counts[ical_uid] > 1:
+            continue
+        ics_blocks[ical_uid] = block_hash
+        gcal_event = existing_events.get(ical_uid)
+        etag = gcal_event.other.get("etag") if gcal_event else None
+        if etag is None or imported.get(block_hash) != [ical_uid, etag]:
+            continue
+        skipped.append(gcal_event)
+        pieces.append(ics_data[pos:start])
+        pos = end
+    pieces.append(ics_data[pos:])
+    return b"".join(pieces), ics_blocks, skipped
+
+
+def dedupe_ical_events(ical_events):
+    """
+    Only keep the latest revision (highest SEQUENCE) of events that appear
+    more than once in the ICS file. Returns the remaining events, in their
+    original order, and the iCalUIDs of the dropped duplicates.
+    """
+    latest = {}
+    duplicates = []
+    for ical_event in ical_events:
+        ical_uid = str(ical_event.get("UID"))
+        recurrence_id = ical_event.get("RECURRENCE-ID")
+        key = (
+            ical_uid,
+            recurrence_id.to_ical() if recurrence_id is not None else None,
+        )
+        other = latest.get(key)
+        if other is None:
+            latest[key] = ical_event
+            continue
+
+        LOGGER.info("Duplicate iCalUID detected: %s", ical_uid)
+        duplicates.append(ical_uid)
+        if int(ical_event.get("SEQUENCE", 0)) > int(other.get("SEQUENCE", 0)):
+            latest[key] = ical_event
+    return list(latest.values()), duplicates
+
+
+def ical_text(value, default=""):
+    # Text properties (vText) are already unescaped str objects, no need to
+    # have icalendar decode them again
+    return str(value) if value is not None else default
 
 
 def ics_to_gcal(ical_event):
+    from gcsa.event import Event as GoogleCalendarEvent
+
+    # Fetch all the properties we need in one go, missing ones are None
+    (
+        uid,
+        summary,
+        description,
+        status,
+        location,
+        transp,
+        dtstart,
+        dtend,
+        rrule,
+    ) = map(ical_event.get, VEVENT_PROPERTIES)
+
     # Metadata
-    ical_uid = str(ical_event.get("UID"))
+    ical_uid = str(uid)
     # sequence = int(ical_event.get("SEQUENCE", 0))
-    transparency = (
-        str(ical_event.get("TRANSP")).lower()
-        if "TRANSP" in ical_event
-        else "opaque"
-    )
+    transparency = ical_text(transp, "opaque").lower()
 
-    summary = (
-        ical_event.decoded("SUMMARY").decode("utf-8").strip()
-        if "SUMMARY" in ical_event
-        else ""
-    )
-    description = (
-        ical_event.decoded("DESCRIPTION").decode("utf-8")
-        if "DESCRIPTION" in ical_event
-        else ""
-    )
-    status = (
-        ical_event.decoded("STATUS").decode("utf-8").lower()
-        if "STATUS" in ical_event
-        else "confirmed"
-    )
-    location = (
-        ical_event.decoded("LOCATION").decode("utf-8")
-        if "LOCATION" in ical_event
-        else ""
-    )
+    summary = ical_text(summary).strip()
+    description = ical_text(description)
+    status = ical_text(status, "confirmed").lower()
+    location = ical_text(location)
 
-    start = ical_event.decoded("DTSTART")
-    end = ical_event.decoded("DTEND")
-    rrule = (
-        "RRULE:" + ical_event.get("RRULE").to_ical().decode("utf-8")
-        if "RRULE" in ical_event
-        else None
-    )
+    start = dtstart.dt
+    end = dtend.dt
+    if rrule is not None:
+        rrule = "RRULE:" + rrule.to_ical().decode("utf-8")
 
     # Create a new Event object with the ICS data
     gcal_event = GoogleCalendarEvent(
@@ -234,7 +743,7 @@ def ics_to_gcal(ical_event):
         transparency=transparency,
     )
     if rrule:
-        LOGGER.warning(f"NEW EVENT RRULE=[{rrule}]")
+        LOGGER.warning("NEW EVENT RRULE=[%s]", rrule)
         gcal_event.recurrence = [rrule]
     if status:
         gcal_event.other["status"] = status
@@ -243,7 +752,289 @@ def ics_to_gcal(ical_event):
     return gcal_event
 
 
-def import_events(gcal, file, proxy=None, auth=None, dry_run=False):
+def gcal_debug_repr(event):
+    """
+    Pretty-printed event attributes for debug logs, without the description
+    """
+    return pformat(
+        {k: v for (k, v) in vars(event).items() if k != "description"}
+    )
+
+
+def gcal_created_intact(gcal_ics_event, res):
+    """
+    Cheap check that a newly created event was not hit by the one known
+    import glitch: being created with status=cancelled
+    """
+    if res.other.get("status") != "cancelled":
+        return True
+    return gcal_ics_event.other.get("status") == "cancelled"
+
+
+def flush_pending_events(gcal, pending, gcal_changes, verify=False):
+    """
+    Send the queued (operation, ICS event, request) tuples to Google Calendar
+    through the batch endpoint and sort the results into gcal_changes.
+    With verify, the results are compared against the ICS events.
+    """
+    from gcsa.serializers.event_serializer import EventSerializer
+
+    if not pending:
+        return
+
+    results = gcal_batch_execute(
+        gcal, [(str(i), request) for i, (_, _, request) in enumerate(pending)]
+    )
+
+    updated = gcal_changes["updated"]
+    created = gcal_changes["created"]
+    failed = gcal_changes["failed"]
+    # Created events that need to be updated right away
+    fixups = []
+
+    for i, (operation, gcal_ics_event, _) in enumerate(pending):
+        response, exc = results[str(i)]
+        if exc:
+            LOGGER.error(
+                "Failed to %s event %s: %s", operation, gcal_ics_event, exc
+            )
+            failed.append(gcal_ics_event)
+            continue
+
+        res = EventSerializer.to_object(response)
+        if operation == "update":
+            if not verify or gcal_compare(
+                gcal_ics_event, res, ignore_sequence=True
+            ):
+                LOGGER.info('✅🆙 Event "%s" successfully updated', res.summary)
+                updated.append(res)
+            else:
+                LOGGER.error(
+                    '❗ Event "%s" did not update correctly', res.summary
+                )
+                failed.append(res)
+            continue
+
+        # FIXME Why does this even happen?
+        # Some recurring events are created with status=cancelled 🤷
+        if (
+            gcal_compare(gcal_ics_event, res, ignore_sequence=True)
+            if verify
+            else gcal_created_intact(gcal_ics_event, res)
+        ):
+            LOGGER.info('✅ Created event "%s" sucessfully', res.summary)
+            created.append(res)
+            continue
+
+        LOGGER.warning(
+            '❗ The event "%s" was not created as intended. '
+            "Let's update it.",
+            res.summary,
+        )
+        LOGGER.debug(
+            "Original (ICS) event status: %s",
+            gcal_ics_event.other.get("status"),
+        )
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug(
+                "GOOGLE CALENDAR API RESULT (w/o description):\n%s",
+                gcal_debug_repr(res),
+            )
+
+        # Copy event data
+        res.summary = gcal_ics_event.summary
+        res.description = gcal_ics_event.description
+        res.transparency = gcal_ics_event.transparency
+        res.location = gcal_ics_event.location
+        res.start = gcal_ics_event.start
+        res.end = gcal_ics_event.end
+        res.recurrence = gcal_ics_event.recurrence
+        # res.other["sequence"] = gcal_ics_event.sequence
+        if gcal_ics_event.other.get("status"):
+            res.other["status"] = gcal_ics_event.other["status"]
+        fixups.append((gcal_ics_event, res))
+
+    if not fixups:
+        return
+
+    results = gcal_batch_execute(
+        gcal,
+        [
+            (str(i), gcal_update_request(gcal, res))
+            for i, (_, res) in enumerate(fixups)
+        ],
+    )
+    for i, (gcal_ics_event, res) in enumerate(fixups):
+        response, exc = results[str(i)]
+        if exc:
+            LOGGER.error(
+                "🚨 Failed to create event %s\n%s", gcal_ics_event, exc
+            )
+            failed.append(gcal_ics_event)
+            continue
+
+        res = EventSerializer.to_object(response)
+        # We need to ignore the sequence here since updating the
+        # event does increase it
+        if verify and not gcal_compare(
+            gcal_ics_event, res, ignore_sequence=True
+        ):
+            LOGGER.critical('💥 Even updating "%s" did not help.', res.summary)
+            LOGGER.debug(
+                "Original (ICS) event status: %s",
+                gcal_ics_event.other.get("status"),
+            )
+            if LOGGER.isEnabledFor(logging.DEBUG):
+                LOGGER.debug(
+                    "GOOGLE CALENDAR API RESULT (w/o description):\n%s",
+                    gcal_debug_repr(res),
+                )
+        else:
+            LOGGER.info('✅ Created event "%s" sucessfully', res.summary)
+        created.append(res)
+
+
+def gcal_instances_request(gcal, parent, gcal_ics_event):
+    """
+    events.instances request for the occurrence of the recurring gcal event
+    parent that falls into the timeframe of gcal_ics_event
+    """
+
+    def rfc3339(value):
+        if not isinstance(value, datetime):
+            value = datetime.combine(value, time.min)
+        # Floating times are local, just like in gcsa
+        if value.tzinfo is None:
+            value = value.astimezone()
+        return value.isoformat()
+
+    return gcal.service.events().instances(
+        calendarId=gcal.calendar,
+        eventId=parent.event_id,
+        timeMin=rfc3339(gcal_ics_event.start),
+        timeMax=rfc3339(gcal_ics_event.end),
+        maxResults=2,
+    )
+
+
+def gcal_find_instances(gcal, occurrences, existing_events, gcal_changes):
+    """
+    Look up the gcal instances matching the (RECURRENCE-ID) ICS events in
+    occurrences through the batch endpoint.
+    Returns (ICS event, gcal instance) pairs. Failed lookups are added to
+    gcal_changes["failed"].
+    """
+    from gcsa.serializers.event_serializer import EventSerializer
+
+    failed = gcal_changes["failed"]
+    # iCalUIDs that could not be found, neither in the index nor in gcal
+    unknown_uids = set()
+    lookups = []
+    for gcal_ics_event in occurrences:
+        ical_uid = gcal_ics_event.other.get("iCalUID")
+        parent = existing_events.get(ical_uid)
+        if parent is None and ical_uid not in unknown_uids:
+            parent = gcal_get_event(gcal, ical_uid)
+            if parent:
+                existing_events[ical_uid] = parent
+            else:
+                unknown_uids.add(ical_uid)
+        if parent is None:
+            LOGGER.error("Failed to find the recurring event %s", ical_uid)
+            failed.append(ical_uid)
+            continue
+        lookups.append((gcal_ics_event, parent))
+
+    results = gcal_batch_execute(
+        gcal,
+        [
+            (str(i), gcal_instances_request(gcal, parent, gcal_ics_event))
+            for i, (gcal_ics_event, parent) in enumerate(lookups)
+        ],
+    )
+
+    instances = []
+    for i, (gcal_ics_event, parent) in enumerate(lookups):
+        ical_uid = gcal_ics_event.other.get("iCalUID")
+        response, exc = results[str(i)]
+        if exc:
+            LOGGER.error(
+                "Failed to find event instances for event %s: %s",
+                ical_uid,
+                exc,
+            )
+            failed.append(ical_uid)
+            continue
+
+        items = response.get("items", [])
+        LOGGER.debug(
+            'Recurring event: "%s" (event ID: %s)',
+            parent.summary,
+            parent.event_id,
+        )
+        LOGGER.debug("Number of matching instances: %s", len(items))
+        if not items:
+            LOGGER.error(
+                "Could not find recurrent event instance for this timeframe"
+            )
+            failed.append(ical_uid)
+            continue
+        elif len(items) > 1:
+            LOGGER.error(
+                "Found more than one event instance. This shouldn't happen."
+            )
+            failed.append(ical_uid)
+            continue
+
+        LOGGER.debug("Event instance ID: %s", items[0].get("id"))
+        instances.append((gcal_ics_event, EventSerializer.to_object(items[0])))
+    return instances
+
+
+def queue_event_update(
+    gcal, gcal_event, gcal_ics_event, pending, gcal_changes, dry_run=False
+):
+    """
+    Queue an update of gcal_event with the ICS data, unless it is up to date
+    """
+    LOGGER.info('Found matching gcal event: "%s"', gcal_event.summary)
+    if gcal_compare(gcal_event, gcal_ics_event, ignore_sequence=True):
+        LOGGER.info("⏩ Same event data. Skip.")
+        gcal_changes["untouched"].append(gcal_event)
+        return
+
+    # Copy event data
+    gcal_event.summary = gcal_ics_event.summary
+    gcal_event.description = gcal_ics_event.description
+    gcal_event.location = gcal_ics_event.location
+    gcal_event.transparency = gcal_ics_event.transparency
+
+    gcal_event.start = gcal_ics_event.start
+    gcal_event.end = gcal_ics_event.end
+    gcal_event.recurrence = gcal_ics_event.recurrence
+    status = gcal_ics_event.other.get("status")
+    if status:
+        gcal_event.other["status"] = status
+
+    if dry_run:
+        LOGGER.info(
+            'Dry run: Would have updated event "%s"', gcal_event.summary
+        )
+        return
+    pending.append(
+        ("update", gcal_ics_event, gcal_update_request(gcal, gcal_event))
+    )
+
+
+def import_events(
+    gcal,
+    file,
+    proxy=None,
+    auth=None,
+    dry_run=False,
+    existing_events=None,
+    verify=False,
+):
     gcal_changes = {
         "updated": [],
         "created": [],
@@ -251,109 +1042,53 @@ def import_events(gcal, file, proxy=None, auth=None, dry_run=False):
         "duplicates": [],
         "unsupported": [],
         "failed": [],
+        # iCalUIDs of all the ICS events, whether importing them worked or not
+        "processed": set(),
     }
-    processed_uids = []
+    if existing_events is None:
+        existing_events = gcal_index_events(gcal)
+    # Imports and updates are queued up and sent in batches
+    pending = []
+    # Occurrences of recurring events, looked up once their parents exist
+    occurrences = []
+
+    # VEVENT blocks that did not change since the last import are skipped
+    cache_path = vevent_cache_path(gcal, file)
+    ics_data, ics_blocks, skipped = strip_unchanged_vevents(
+        read_ics(file, proxy, auth),
+        load_vevent_cache(cache_path),
+        existing_events,
+    )
+    if skipped:
+        LOGGER.info("⏩ Skipping %s unchanged events of %s", len(skipped), file)
+        gcal_changes["untouched"].extend(skipped)
+        gcal_changes["processed"].update(
+            event.other.get("iCalUID") for event in skipped
+        )
 
-    for ical_event in read_ics(file, proxy, auth):
+    ical_events, duplicates = dedupe_ical_events(parse_ics(ics_data))
+    gcal_changes["duplicates"].extend(duplicates)
+
+    for ical_event in ical_events:
         # Create a new Event object with the ICS data
         gcal_ics_event = ics_to_gcal(ical_event)
         ical_uid = gcal_ics_event.other.get("iCalUID")
-        status = gcal_ics_event.other.get("status")
+        gcal_changes["processed"].add(ical_uid)
 
-        LOGGER.info(f'Processing ICS event "{gcal_ics_event.summary}"\n')
-        LOGGER.debug(f"UID: {ical_uid}")
+        LOGGER.info('Processing ICS event "%s"\n', gcal_ics_event.summary)
+        LOGGER.debug("UID: %s", ical_uid)
 
         # Check if this is an instance of a recurring event
         if "RECURRENCE-ID" in ical_event:
             LOGGER.debug("This event is an occurence of a recurring event")
-
-            # Fetch event instance
-            gcal_parent_event = gcal_get_event(gcal, ical_uid)
-            try:
-                gcal_events = list(
-                    gcal.get_instances(
-                        recurring_event=gcal_parent_event,
-                        time_min=gcal_ics_event.start,
-                        time_max=gcal_ics_event.end,
-                        maxResults=2,
-                    )
-                )
-            except Exception as exc:
-                LOGGER.error(
-                    f"Failed to find event instances for event {ical_uid}: {exc}"
-                )
-                gcal_changes.get("failed").append(ical_uid)
-                continue
-
-            LOGGER.debug(
-                f'Recurring event: "{gcal_parent_event.summary}" '
-                f"(event ID: {gcal_parent_event.event_id})"
-            )
-            LOGGER.debug(f"Number of matching instances: {len(gcal_events)}")
-            if gcal_events:
-                LOGGER.debug(f"Event instance ID: {gcal_events[0].event_id}")
-
-            if not gcal_events:
-                LOGGER.error(
-                    "Could not find recurrent event instance for this timeframe"
-                )
-                gcal_changes.get("failed").append(ical_uid)
-                continue
-            elif len(gcal_events) > 1:
-                LOGGER.error(
-                    "Found more than one event instance. "
-                    "This shouldn't happen."
-                )
-                gcal_changes.get("failed").append(ical_uid)
-                continue
-
-            gcal_event = gcal_events[0]
-
-        # Check if we already processed this iCalUID
-        elif ical_uid in processed_uids:
-            LOGGER.info("Duplicate iCalUID detected. Skip item.")
-            gcal_changes.get("duplicates").append(ical_uid)
+            occurrences.append(gcal_ics_event)
             continue
-        else:
-            gcal_event = gcal_get_event(gcal, ical_uid)
-
-        processed_uids.append(ical_uid)
 
+        gcal_event = existing_events.get(ical_uid)
         if gcal_event:
-            # Update event
-            LOGGER.info(f'Found matching gcal event: "{gcal_event.summary}"')
-            if gcal_compare(gcal_event, gcal_ics_event, ignore_sequence=True):
-                LOGGER.info("⏩ Same event data. Skip.")
-                gcal_changes["untouched"].append(gcal_event)
-            else:
-
-                # Copy event data
-                gcal_event.summary = gcal_ics_event.summary
-                gcal_event.description = gcal_ics_event.description
-                gcal_event.location = gcal_ics_event.location
-                gcal_event.transparency = gcal_ics_event.transparency
-
-                gcal_event.start = gcal_ics_event.start
-                gcal_event.end = gcal_ics_event.end
-                gcal_event.recurrence = gcal_ics_event.recurrence
-                if status:
-                    gcal_event.other["status"] = status
-
-                if dry_run:
-                    LOGGER.info(
-                        "Dry run: Would have updated event "
-                        f'"{gcal_event.summary}"'
-                    )
-                else:
-                    updated_event = gcal.update_event(gcal_event)
-                    if gcal_compare(
-                        gcal_ics_event, updated_event, ignore_sequence=True
-                    ):
-                        LOGGER.info("✅🆙 Event successfully updated")
-                        gcal_changes["updated"].append(updated_event)
-                    else:
-                        LOGGER.error("❗ Event did not update correctly")
-                        gcal_changes["failed"].append(updated_event)
+            queue_event_update(
+                gcal, gcal_event, gcal_ics_event, pending, gcal_changes, dry_run
+            )
             continue
 
         # Create new event
@@ -361,112 +1096,88 @@ def import_events(gcal, file, proxy=None, auth=None, dry_run=False):
 
         if dry_run:
             LOGGER.info(
-                "Dry run: Would have created event"
-                f'"{gcal_ics_event.summary}"'
+                'Dry run: Would have created event "%s"', gcal_ics_event.summary
             )
             continue
-        try:
-            LOGGER.debug(
-                f"New event: {gcal_ics_event} (RRULE: {gcal_ics_event.recurrence})"
+        LOGGER.debug(
+            "New event: %s (RRULE: %s)",
+            gcal_ics_event,
+            gcal_ics_event.recurrence,
+        )
+        pending.append(
+            (
+                "import",
+                gcal_ics_event,
+                gcal_import_request(gcal, gcal_ics_event),
             )
-            try:
-                res = gcal.import_event(gcal_ics_event)
-            except Exception as exc:
-                LOGGER.error(f"Failed to import event {gcal_ics_event}: {exc}")
-                gcal_changes["failed"].append(gcal_ics_event)
-                continue
+        )
 
-            # FIXME Why does this even happen?
-            # Some recurring events are created with status=cancelled 🤷
-            if not gcal_compare(gcal_ics_event, res, ignore_sequence=True):
-                LOGGER.warning(
-                    "❗ The event was not created as intended. "
-                    "Let's update it."
-                )
-                LOGGER.debug(f"Original (ICS) event status: {status}")
-                LOGGER.debug(
-                    "GOOGLE CALENDAR API RESULT (w/o description):\n"
-                    + pformat(
-                        {
-                            k: v
-                            for (k, v) in vars(res).items()
-                            if k != "description"
-                        }
-                    )
-                )
+    if occurrences:
+        # The parent events might still be waiting in the queue
+        flush_pending_events(gcal, pending, gcal_changes, verify)
+        pending = []
+        # Index the events we just created, they are the parents of the
+        # recurring event instances
+        for event in gcal_changes["created"]:
+            existing_events.setdefault(event.other.get("iCalUID"), event)
+
+        for gcal_ics_event, gcal_event in gcal_find_instances(
+            gcal, occurrences, existing_events, gcal_changes
+        ):
+            queue_event_update(
+                gcal, gcal_event, gcal_ics_event, pending, gcal_changes, dry_run
+            )
 
-                # Copy event data
-                res.summary = gcal_ics_event.summary
-                res.description = gcal_ics_event.description
-                res.transparency = gcal_ics_event.transparency
-                res.location = gcal_ics_event.location
-                res.start = gcal_ics_event.start
-                res.end = gcal_ics_event.end
-                res.recurrence = gcal_ics_event.recurrence
-                # res.other["sequence"] = gcal_ics_event.sequence
-                if gcal_ics_event.other.get("status"):
-                    res.other["status"] = gcal_ics_event.other["status"]
-                res = gcal.update_event(res)
-
-                # We need to ignore the sequence here since updating the
-                # event does increase it
-                if not gcal_compare(gcal_ics_event, res, ignore_sequence=True):
-                    LOGGER.critical("💥 Even updating did not help.")
-                    LOGGER.debug(f"Original (ICS) event status: {status}")
-                    LOGGER.debug(
-                        "GOOGLE CALENDAR API RESULT (w/o description):\n"
-                        + pformat(
-                            {
-                                k: v
-                                for (k, v) in vars(res).items()
-                                if k != "description"
-                            }
-                        )
-                    )
-                else:
-                    LOGGER.info("✅ Created event sucessfully")
-            else:
-                LOGGER.info("✅ Created event sucessfully")
-            gcal_changes["created"].append(res)
-        except Exception as exc:
-            LOGGER.error(f"🚨 Failed to create event\n{exc}")
-            raise exc
+    flush_pending_events(gcal, pending, gcal_changes, verify)
+
+    if not dry_run:
+        save_vevent_cache(cache_path, ics_blocks, gcal_changes)
 
     return gcal_changes
 
 
 def delete_other_events(
-    gcal, imported_events, include_past_events=False, dry_run=False
+    gcal,
+    imported_events,
+    include_past_events=False,
+    dry_run=False,
+    existing_events=None,
 ):
-    LOGGER.warning("Searching for fringe events")
-    deleted_count = 0
-    min = datetime(1970, 1, 1) if include_past_events else datetime.now()
-    # Fetch all events
-    events = list(gcal.get_events(time_min=min, time_max=datetime(3000, 1, 1)))
-
-    imported_uids = [
-        x.other["iCalUID"]
-        for x in imported_events.get("updated")
-        + imported_events.get("created")
-        + imported_events.get("untouched")
+    LOGGER.warning("Searching for fringe events in %s", gcal.calendar)
+    now = datetime.now().astimezone()
+    if existing_events is None:
+        # Recurring events are not expanded, only their masters are
+        # compared against the imported iCalUIDs
+        existing_events = gcal_index_events(gcal)
+    events = [
+        ev
+        for ev in existing_events.values()
+        if include_past_events or not gcal_event_is_past(ev, now)
     ]
 
+    # Events that failed to update are still part of the ICS, they must not
+    # be deleted
+    imported_uids = imported_events["processed"]
+
+    fringe_events = []
     for ev in events:
         if ev.other["iCalUID"] not in imported_uids:
             if dry_run:
                 LOGGER.info(
-                    f"Dry run: Would have deleted fringe event {ev.summary}"
+                    "Dry run: Would have deleted fringe event %s", ev.summary
                 )
             else:
                 LOGGER.warning(
-                    f"🕵️  Fringe event found: {ev.summary}. Deleting it!"
+                    "🕵️  Fringe event found: %s. Deleting it!", ev.summary
                 )
-                gcal.delete_event(ev)
-                deleted_count = deleted_count + 1
-    return deleted_count
+                fringe_events.append(ev)
+    return gcal_delete_events(gcal, fringe_events)
 
 
 def get_confluence_calendar_info(url: str, username: str, password: str):
+    # atlassian-python-api is slow to import and only needed for Confluence
+    from atlassian import Confluence
+
     confluence_client = Confluence(url, username=username, password=password)
     cal_metadata = []
     for c in confluence_client.team_calendars_get_sub_calendars().get(
@@ -556,6 +1267,13 @@ def parse_args():
         default=False,
         help="Dry-run. Do not add/remove/update any events",
     )
+    parser.add_argument(
+        "--verify",
+        required=False,
+        action="store_true",
+        default=False,
+        help="Compare created and updated events with the ICS data",
+    )
     parser.add_argument(
         "CALENDAR", nargs="?", help="Google Calendar ID or name"
     )
@@ -563,6 +1281,52 @@ def parse_args():
     return parser.parse_args()
 
 
+def gcal_calendar_id(gcal, calendar_name, token_path, refresh=False):
+    """
+    ID of the calendar named calendar_name, which gets created if need be.
+    The calendar names and IDs of the account are cached for
+    CALENDARS_CACHE_TTL seconds, refresh bypasses the cache.
+    """
+    cache_key = hashlib.sha256(
+        os.path.abspath(token_path).encode("utf-8")
+    ).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, f"{cache_key}.calendars.json")
+
+    calendars = {}
+    try:
+        age = datetime.now().timestamp() - os.path.getmtime(cache_path)
+        if not refresh and age < CALENDARS_CACHE_TTL:
+            with open(cache_path) as f:
+                calendars = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if calendar_name in calendars:
+        return calendars[calendar_name]
+
+    # Find calendar ID
+    calendars = {}
+    for x in gcal.service.calendarList().list().execute().get("items"):
+        calendars.setdefault(x.get("summary"), x.get("id"))
+    if calendar_name not in calendars:
+        LOGGER.warning(
+            f"Could not find any calendar named {calendar_name}. "
+            f"Creating a new calendar named {calendar_name}"
+        )
+        # Create new calendar
+        new_calendar = {
+            "summary": calendar_name,
+            # 'timeZone': 'Europe/Berlin'
+        }
+        res = gcal.service.calendars().insert(body=new_calendar).execute()
+        calendars[calendar_name] = res["id"]
+
+    write_cache_file(
+        cache_path, json.dumps(calendars).encode("utf-8"), "calendar IDs"
+    )
+
+    return calendars[calendar_name]
+
+
 def import_ics(
     credentials,
     token_path,
@@ -573,45 +1337,51 @@ def import_ics(
     clear=False,
     delete=False,
     dry_run=False,
+    verify=False,
+    gcal=None,
 ):
-    gcal = GoogleCalendar(
-        credentials_path=credentials,
-        token_path=token_path,
-    )
+    from gcsa.google_calendar import GoogleCalendar
+    from googleapiclient.errors import HttpError as GoogleHttpError
+
+    if gcal is None:
+        gcal = GoogleCalendar(
+            credentials_path=credentials,
+            token_path=token_path,
+        )
 
     # Set calendar ID
-    if re.match(".+@group.calendar.google.com", calendar_name):
+    if CALENDAR_ID_RE.match(calendar_name):
         calendar_id = calendar_name
     else:
-        # Find calendar ID
-        calendars = [
-            x.get("id")
-            for x in gcal.service.calendarList().list().execute().get("items")
-            if x.get("summary") == calendar_name
-        ]
-        if not calendars:
-            LOGGER.warning(
-                f"Could not find any calendar named {calendar_name}. "
-                f"Creating a new calendar named {calendar_name}"
-            )
-            # Create new calendar
-            new_calendar = {
-                "summary": calendar_name,
-                # 'timeZone': 'Europe/Berlin'
-            }
-            res = gcal.service.calendars().insert(body=new_calendar).execute()
-            calendar_id = res["id"]
-        else:
-            calendar_id = calendars[0]
+        calendar_id = gcal_calendar_id(gcal, calendar_name, token_path)
 
     gcal.calendar = calendar_id
-    LOGGER.debug(f"CALENDAR ID: {calendar_id}")
+    LOGGER.debug(f"{calendar_name}: CALENDAR ID: {calendar_id}")
+
+    # Fetch the existing events once, for both the import and the deletion
+    try:
+        existing_events = gcal_index_events(gcal)
+    except GoogleHttpError as exc:
+        # The cached ID of a calendar that has been deleted since
+        if calendar_id == calendar_name or int(exc.resp.status) != 404:
+            raise
+        LOGGER.warning(
+            f"Calendar {calendar_id} does not exist anymore, "
+            f"looking up {calendar_name} again"
+        )
+        calendar_id = gcal_calendar_id(
+            gcal, calendar_name, token_path, refresh=True
+        )
+        gcal.calendar = calendar_id
+        existing_events = gcal_index_events(gcal)
 
     # FIXME Check the ICS file/url first.
     # Clear?
     if clear:
-        deleted = gcal_clear(gcal, dry_run)
-        LOGGER.warning(f"✂️ Deleted {deleted} events")
+        deleted = gcal_clear(gcal, dry_run, existing_events)
+        LOGGER.warning(f"✂️ {calendar_name}: Deleted {deleted} events")
+        # Catch up with the deletions
+        existing_events = gcal_index_events(gcal)
 
     # Import
     events = import_events(
@@ -620,24 +1390,44 @@ def import_ics(
         proxy=proxy,
         auth=auth,
         dry_run=dry_run,
+        existing_events=existing_events,
+        verify=verify,
     )
     LOGGER.info(
-        f"ℹ️ Imported {len(events['created'])} and "
+        f"ℹ️ {calendar_name}: Imported {len(events['created'])} and "
         f"updated {len(events['updated'])} events."
     )
-    LOGGER.info(f"👌 {len(events['untouched'])} events were left untouched.")
-    LOGGER.info(f"👯 Duplicates count: {len(events['duplicates'])}")
-    LOGGER.info(f"🤷 Unsupported items: {len(events['unsupported'])}")
-    LOGGER.info(f"😞 Failed items: {len(events['failed'])} ")
-    LOGGER.debug(f"Failed items:\n{pformat(events['failed'])}")
+    LOGGER.info(
+        f"👌 {calendar_name}: {len(events['untouched'])} events were left "
+        "untouched."
+    )
+    LOGGER.info(
+        f"👯 {calendar_name}: Duplicates count: {len(events['duplicates'])}"
+    )
+    LOGGER.info(
+        f"🤷 {calendar_name}: Unsupported items: "
+        f"{len(events['unsupported'])}"
+    )
+    LOGGER.info(f"😞 {calendar_name}: Failed items: {len(events['failed'])} ")
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        LOGGER.debug(
+            "%s: Failed items:\n%s", calendar_name, pformat(events["failed"])
+        )
 
     if delete:
         if events or dry_run:
-            deleted = delete_other_events(gcal, events, dry_run=dry_run)
-            LOGGER.warning(f"✂️ Deleted {deleted} fringe events")
+            deleted = delete_other_events(
+                gcal,
+                events,
+                dry_run=dry_run,
+                existing_events=existing_events,
+            )
+            LOGGER.warning(
+                f"✂️ {calendar_name}: Deleted {deleted} fringe events"
+            )
         else:
             LOGGER.error(
-                "🚨 No event was imported."
+                f"🚨 {calendar_name}: No event was imported. "
                 "Deletion of fringe events was skipped."
             )
             return
@@ -646,6 +1436,8 @@ def import_ics(
 
 
 def main():
+    import coloredlogs
+
     args = parse_args()
 
     logging.getLogger("googleapiclient.discovery_cache").setLevel(
@@ -657,20 +1449,31 @@ def main():
         fmt="[%(asctime)s] %(levelname)s %(message)s",
     )
     if args.confluence_url:
+        from gcsa.google_calendar import GoogleCalendar
+
         confluence_calendars = get_confluence_calendar_info(
             args.confluence_url,
             args.confluence_username,
             args.confluence_password,
         )
         LOGGER.debug(f"{confluence_calendars}")
-        res = []
+        # Load the credentials once. Each calendar gets its own API client
+        # though, since they are not thread-safe.
+        credentials = GoogleCalendar(
+            credentials_path=args.credentials,
+            token_path=args.token,
+        ).credentials
+        calendars = []
         for ccal in confluence_calendars:
             if args.confluence_calendars and ccal.get("name").lower() not in [
                 x.lower() for x in args.confluence_calendars
             ]:
                 LOGGER.warning(f"Skipping calendar {ccal.get('name')}")
                 continue
-            res = import_ics(
+            calendars.append(ccal)
+
+        def sync(ccal):
+            return import_ics(
                 credentials=args.credentials,
                 token_path=args.token,
                 calendar_name=f"{args.confluence_calendar_prefix}{ccal.get('name')}",
@@ -683,8 +1486,13 @@ def main():
                 clear=args.clear,
                 delete=args.delete,
                 dry_run=args.dry_run,
+                verify=args.verify,
+                gcal=GoogleCalendar(credentials=credentials),
             )
-        return res
+
+        with ThreadPoolExecutor(max_workers=CALENDAR_WORKERS) as executor:
+            res = list(executor.map(sync, calendars))
+        return bool(res) and all(res)
     else:
         return import_ics(
             credentials=args.credentials,
@@ -695,6 +1503,7 @@ def main():
             clear=args.clear,
             delete=args.delete,
             dry_run=args.dry_run,
+            verify=args.verify,
         )
 
 